@@ -109,7 +109,8 @@ if [ $? -eq 0 ]; then
     echo ""
     echo "📊 Post-deployment checks:"
     echo "  Service status: ssh root@$SERVER_IP 'systemctl status $SERVICE'"
-    echo "  Live logs: ssh root@$SERVER_IP 'journalctl -u $SERVICE -f'"
+    echo "  Live logs: ssh root@$SERVER_IP 'tail -f /opt/ai-music-stream/logs/app.log'"
+    echo "  Warnings/errors: ssh root@$SERVER_IP 'journalctl -u $SERVICE -f'"
     echo "  Health check: curl http://$SERVER_IP:$PORT/health"
     echo ""
     if [ "$ENVIRONMENT" = "dev" ]; then
@@ -122,6 +123,7 @@ if [ $? -eq 0 ]; then
 else
     echo ""
     echo "❌ Deployment failed!"
-    echo "Check server logs: ssh root@$SERVER_IP 'journalctl -u $SERVICE -f'"
+    echo "Check server logs: ssh root@$SERVER_IP 'tail -n 50 /opt/ai-music-stream/logs/app.log'"
+    echo "Service errors: ssh root@$SERVER_IP 'journalctl -u $SERVICE -n 50'"
     exit 1
 fi
\ No newline at end of file
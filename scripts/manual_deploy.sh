@@ -61,7 +61,7 @@ echo "7. Check service status:"
 echo "   systemctl status $SERVICE"
 echo ""
 echo "8. View logs:"
-echo "   journalctl -u $SERVICE -f"
+echo "   tail -f /opt/ai-music-stream/logs/app.log"
 echo ""
 
 echo "📋 Run these commands on the server, then press Enter to continue..."
@@ -75,10 +75,10 @@ echo "# Check if service is running:"
 echo "systemctl is-active $SERVICE"
 echo ""
 echo "# View recent logs:"
-echo "journalctl -u $SERVICE -n 20"
+echo "tail -n 20 /opt/ai-music-stream/logs/app.log"
 echo ""
-echo "# Check application logs:"
-echo "tail -f /opt/ai-music-stream/logs/app.log"
+echo "# Check service warnings and errors (stdout only carries WARNING and above):"
+echo "journalctl -u $SERVICE -n 20"
 echo ""
 
 if [ "$ENVIRONMENT" = "dev" ]; then
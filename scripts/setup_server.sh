@@ -146,5 +146,5 @@ echo "📋 Useful commands:"
 echo "  SSH to server: ssh ai-stream-server"
 echo "  Check production service: systemctl status ai-music-stream-prod"
 echo "  Check development service: systemctl status ai-music-stream-dev"
-echo "  View production logs: journalctl -u ai-music-stream-prod -f"
-echo "  View development logs: journalctl -u ai-music-stream-dev -f"
\ No newline at end of file
+echo "  View application logs: tail -f /opt/ai-music-stream/logs/app.log"
+echo "  View service warnings/errors: journalctl -u ai-music-stream-prod -f"
\ No newline at end of file
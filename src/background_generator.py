@@ -4,25 +4,135 @@ Background Video Generator for AI Music Stream
 Generates animated backgrounds that match music mood and user requests
 """
 
+import aiofiles
+import aiohttp
 import asyncio
+import hashlib
 import json
 import logging
+import numpy as np
 import os
-import requests
+import random
+import shutil
 import time
+import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from types import MappingProxyType
+from typing import Dict, Final, List, Optional, Any, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Background generation settings
+VIDEO_SETTINGS: Final = MappingProxyType({
+    'duration': 30,  # seconds - enough for seamless looping
+    'resolution': '1920x1080',
+    'fps': 30,
+    'format': 'mp4'
+})
+
+# Mood-to-visual mappings (immutable variants, one picked per mood per day)
+MOOD_PROMPTS: Final = MappingProxyType({
+    'chill': (
+        'flowing abstract waves in soft pastels, gentle movement',
+        'minimalist geometric shapes floating peacefully',
+        'soft cloud formations drifting slowly across gradient sky'
+    ),
+    'energetic': (
+        'dynamic particle systems with vibrant colors',
+        'fast-moving geometric patterns in bright neon',
+        'pulsing light effects with rhythmic energy'
+    ),
+    'ambient': (
+        'ethereal mist floating in space, very slow movement',
+        'subtle color gradients slowly shifting and blending',
+        'zen-like water ripples in monochrome'
+    ),
+    'jazz': (
+        'smooth smoke swirls with warm golden tones',
+        'vintage vinyl record spinning with abstract elements',
+        'art deco patterns flowing with musical rhythm'
+    ),
+    'electronic': (
+        'digital grid patterns with neon accents',
+        'cyberpunk-inspired geometric animations',
+        'holographic interfaces with futuristic elements'
+    ),
+    'nature': (
+        'peaceful forest with gentle leaf movement',
+        'calm ocean waves under sunset sky',
+        'flowing river through misty mountains'
+    ),
+    'study': (
+        'library atmosphere with floating books and papers',
+        'desk setup with gentle lighting and coffee steam',
+        'cozy room with soft lamp glow and plants'
+    ),
+    'rain': (
+        'gentle raindrops on window with city lights',
+        'peaceful rainfall in forest with soft lighting',
+        'water droplets creating ripples on calm surface'
+    )
+})
+
+# Time-based visual themes
+TIME_THEMES: Final = MappingProxyType({
+    'morning': 'sunrise colors, warm golden light, fresh beginnings',
+    'afternoon': 'bright natural lighting, clear skies, vibrant energy',
+    'evening': 'sunset hues, warm orange and pink tones, winding down',
+    'night': 'dark blues and purples, starry effects, peaceful atmosphere',
+    'late_night': 'deep darkness with subtle neon, midnight vibes'
+})
+
+# Seasonal themes
+SEASONAL_THEMES: Final = MappingProxyType({
+    'spring': 'fresh green colors, blooming flowers, renewal energy',
+    'summer': 'bright warm colors, sunny atmosphere, vacation vibes',
+    'autumn': 'orange and red leaves, cozy atmosphere, harvest colors',
+    'winter': 'cool blues and whites, snow effects, minimal warmth'
+})
+
+# Weather condition visuals
+WEATHER_PROMPTS: Final = MappingProxyType({
+    'rain': 'gentle raindrops on glass, soft reflections, peaceful atmosphere',
+    'sunny': 'warm sunlight filtering through, bright and cheerful',
+    'cloudy': 'soft cloud formations, muted lighting, calm ambiance',
+    'snow': 'gentle snowfall, winter wonderland, serene white landscape',
+    'storm': 'dramatic clouds with distant lightning, powerful yet beautiful',
+    'clear': 'clear skies with subtle gradients, peaceful and open'
+})
+
+# Lookup tables: hour of day -> TIME_THEMES key, month - 1 -> SEASONAL_THEMES key
+_HOUR_TO_TIME: Final = (
+    ('late_night',) * 5 + ('morning',) * 7 + ('afternoon',) * 5 +
+    ('evening',) * 4 + ('night',) * 3
+)
+_MONTH_TO_SEASON: Final = (
+    ('winter',) * 2 + ('spring',) * 3 + ('summer',) * 3 +
+    ('autumn',) * 3 + ('winter',)
+)
+
 class BackgroundGenerator:
     """Generates animated backgrounds using Adobe Firefly API"""
     
+    __slots__ = (
+        'api_key', 'api_url', 'timeout', 'max_concurrency', 'max_retries', 'cache_max_bytes',
+        'loop_crossfade', 'loop_seam_threshold', 'headers', 'session', 'semaphore',
+        'cache_dir', 'cache_index_path', 'cache_index', '_index_lock', '_inflight', 'width', 'height',
+        '_prompt_tail'
+    )
+    
     def __init__(self):
         self.api_key = os.getenv('ADOBE_FIREFLY_API_KEY')
         self.api_url = os.getenv('ADOBE_FIREFLY_API_URL', 'https://firefly-api.adobe.io/v2')
         self.timeout = int(os.getenv('ADOBE_FIREFLY_API_TIMEOUT', '120'))
+        self.max_concurrency = int(os.getenv('FIREFLY_MAX_CONCURRENCY', '8'))
+        self.max_retries = 5
+        self.cache_max_bytes = int(os.getenv('BACKGROUND_CACHE_MAX_MB', '2048')) * 1024 * 1024
+        
+        # Seamless loop post-processing
+        self.loop_crossfade = 1.0  # seconds blended from the tail back into the head
+        self.loop_seam_threshold = 20.0  # first/last frame MSE below this is already seamless
         
         if not self.api_key:
             raise ValueError("ADOBE_FIREFLY_API_KEY environment variable is required")
@@ -33,74 +143,28 @@ class BackgroundGenerator:
             'X-API-Key': self.api_key
         }
         
-        # Background generation settings
-        self.video_settings = {
-            'duration': 30,  # seconds - enough for seamless looping
-            'resolution': '1920x1080',
-            'fps': 30,
-            'format': 'mp4'
-        }
+        # Shared HTTP session and concurrency limit, created in initialize(). The session is
+        # the single HTTP client for this class: keep-alive connections and cached DNS are
+        # reused across generation, polling and download requests
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
         
-        # Mood-to-visual mappings
-        self.mood_prompts = {
-            'chill': [
-                'flowing abstract waves in soft pastels, gentle movement',
-                'minimalist geometric shapes floating peacefully',
-                'soft cloud formations drifting slowly across gradient sky'
-            ],
-            'energetic': [
-                'dynamic particle systems with vibrant colors',
-                'fast-moving geometric patterns in bright neon',
-                'pulsing light effects with rhythmic energy'
-            ],
-            'ambient': [
-                'ethereal mist floating in space, very slow movement',
-                'subtle color gradients slowly shifting and blending',
-                'zen-like water ripples in monochrome'
-            ],
-            'jazz': [
-                'smooth smoke swirls with warm golden tones',
-                'vintage vinyl record spinning with abstract elements',
-                'art deco patterns flowing with musical rhythm'
-            ],
-            'electronic': [
-                'digital grid patterns with neon accents',
-                'cyberpunk-inspired geometric animations',
-                'holographic interfaces with futuristic elements'
-            ],
-            'nature': [
-                'peaceful forest with gentle leaf movement',
-                'calm ocean waves under sunset sky',
-                'flowing river through misty mountains'
-            ],
-            'study': [
-                'library atmosphere with floating books and papers',
-                'desk setup with gentle lighting and coffee steam',
-                'cozy room with soft lamp glow and plants'
-            ],
-            'rain': [
-                'gentle raindrops on window with city lights',
-                'peaceful rainfall in forest with soft lighting',
-                'water droplets creating ripples on calm surface'
-            ]
-        }
+        # Generated-background cache index, persisted to videos/cache/index.json
+        self.cache_dir = Path('videos/cache')
+        self.cache_index_path = self.cache_dir / 'index.json'
+        self.cache_index: Dict[str, Dict] = {}
+        self._index_lock: Optional[asyncio.Lock] = None  # serializes index writes, created in initialize()
         
-        # Time-based visual themes
-        self.time_themes = {
-            'morning': 'sunrise colors, warm golden light, fresh beginnings',
-            'afternoon': 'bright natural lighting, clear skies, vibrant energy',
-            'evening': 'sunset hues, warm orange and pink tones, winding down',
-            'night': 'dark blues and purples, starry effects, peaceful atmosphere',
-            'late_night': 'deep darkness with subtle neon, midnight vibes'
-        }
+        # In-flight generations keyed by enhanced-prompt hash, shared by concurrent callers
+        self._inflight: Dict[str, asyncio.Future] = {}
         
-        # Seasonal themes
-        self.seasonal_themes = {
-            'spring': 'fresh green colors, blooming flowers, renewal energy',
-            'summer': 'bright warm colors, sunny atmosphere, vacation vibes',
-            'autumn': 'orange and red leaves, cozy atmosphere, harvest colors',
-            'winter': 'cool blues and whites, snow effects, minimal warmth'
-        }
+        # Precomputed values for the per-prompt hot path
+        self.width, self.height = map(int, VIDEO_SETTINGS['resolution'].split('x'))
+        self._prompt_tail = (
+            f", seamless loop animation, {VIDEO_SETTINGS['duration']} seconds, "
+            f"smooth transitions, abstract style suitable for background, "
+            f"no text or logos, continuous motion, {VIDEO_SETTINGS['resolution']} resolution"
+        )
     
     async def initialize(self):
         """Initialize the background generator"""
@@ -110,6 +174,24 @@ class BackgroundGenerator:
         Path('videos').mkdir(exist_ok=True)
         Path('videos/backgrounds').mkdir(exist_ok=True)
         Path('videos/cache').mkdir(exist_ok=True)
+        self.cache_index = self._load_cache_index()
+        
+        # One pooled session for all Firefly traffic
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=128,
+                    limit_per_host=16,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=75,
+                    enable_cleanup_closed=True
+                ),
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=self.timeout)
+            )
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self._index_lock is None:
+            self._index_lock = asyncio.Lock()
         
         # Test API connectivity
         try:
@@ -128,149 +210,213 @@ class BackgroundGenerator:
         """Test API connectivity"""
         try:
             # Test with a simple endpoint (this may need to be adjusted based on actual API)
-            response = requests.get(
+            async with self.session.get(
                 f"{self.api_url}/status",  # Placeholder - adjust based on actual API
-                headers=self.headers,
-                timeout=10
-            )
-            return response.status_code in [200, 401]  # 401 might mean API key issue but API is accessible
+                headers=self.headers
+            ) as response:
+                return response.status in [200, 401]  # 401 might mean API key issue but API is accessible
         except Exception as e:
             logger.warning(f"API test failed: {e}")
             return False
     
+    def _backoff_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Delay before the next retry, honouring a Retry-After header in seconds"""
+        if retry_after:
+            try:
+                return min(float(retry_after), 60.0)
+            except ValueError:
+                pass  # HTTP-date form, fall back to exponential backoff
+        return min(2 ** attempt + random.random(), 30.0)
+    
+    async def _request_json(self, method: str, url: str, idempotency_key: Optional[str] = None,
+                            **kwargs) -> Tuple[int, Any]:
+        """Send a Firefly API request with concurrency limit and retry/backoff
+        
+        Retries on 429, 5xx and connection errors. Returns (status, body) where
+        body is the decoded JSON for 200 responses and the raw text otherwise.
+        """
+        headers = self.headers
+        if idempotency_key:
+            headers = {**self.headers, 'Idempotency-Key': idempotency_key}
+        
+        async with self.semaphore:
+            for attempt in range(self.max_retries):
+                last_attempt = attempt == self.max_retries - 1
+                try:
+                    async with self.session.request(method, url, headers=headers, **kwargs) as response:
+                        status = response.status
+                        retryable = status == 429 or status >= 500
+                        if not retryable or last_attempt:
+                            if status == 200:
+                                return status, await response.json()
+                            return status, await response.text()
+                        retry_after = response.headers.get('Retry-After')
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    if last_attempt:
+                        raise
+                    status, retry_after = e, None
+                
+                delay = self._backoff_delay(attempt, retry_after)
+                logger.warning(f"⚠️ Firefly request failed ({status}), retrying in {delay:.1f}s "
+                               f"(attempt {attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+    
     async def generate_background(self, prompt: str, mood: str = 'chill', 
                                 metadata: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
         """Generate an animated background video"""
         try:
-            logger.info(f"🎬 Generating background: {prompt[:50]}...")
+            # Reuse an earlier clip for the same mood/time/season/prompt combination
+            cache_key = self._cache_key(prompt, mood)
+            cached = self._cache_lookup(cache_key)
+            if cached:
+                logger.info(f"📁 Using cached background: {cached['filename']}")
+                return cached
             
             # Enhanced prompt with technical specifications
             enhanced_prompt = self._enhance_prompt(prompt, mood, metadata)
             
-            # Generate video using Firefly API
-            generation_result = await self._call_firefly_api(enhanced_prompt)
-            
-            if generation_result:
-                # Download and process the generated video
-                video_path = await self._download_video(generation_result)
-                
-                if video_path:
-                    # Post-process for seamless looping
-                    processed_path = await self._process_for_looping(video_path)
-                    
-                    return {
-                        'filename': processed_path,
-                        'prompt': prompt,
-                        'mood': mood,
-                        'duration': self.video_settings['duration'],
-                        'resolution': self.video_settings['resolution'],
-                        'created_at': datetime.now().isoformat(),
-                        'metadata': metadata or {}
-                    }
+            # Coalesce concurrent requests for the same prompt into a single generation
+            flight_key = hashlib.blake2b(enhanced_prompt.encode(), digest_size=16).hexdigest()
+            task = self._inflight.get(flight_key)
+            if task is None:
+                task = asyncio.ensure_future(
+                    self._generate_uncached(prompt, mood, metadata, enhanced_prompt, cache_key)
+                )
+                self._inflight[flight_key] = task
+                task.add_done_callback(lambda _: self._inflight.pop(flight_key, None))
+            else:
+                logger.info(f"⏳ Joining in-flight background generation: {(prompt or mood)[:50]}...")
             
-            logger.error("❌ Background generation failed")
-            return None
+            # Shield so one caller being cancelled doesn't abort the job for the others
+            result = await asyncio.shield(task)
+            return dict(result) if result else None
             
         except Exception as e:
             logger.error(f"❌ Error generating background: {e}")
             return None
     
+    async def _generate_uncached(self, prompt: str, mood: str, metadata: Optional[Dict],
+                                 enhanced_prompt: str, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Run one Firefly generation, post-process it and add it to the cache"""
+        logger.info(f"🎬 Generating background: {(prompt or mood)[:50]}...")
+        
+        # Generate video using Firefly API
+        generation_result = await self._call_firefly_api(enhanced_prompt)
+        
+        if generation_result:
+            # Download and process the generated video
+            video_path = await self._download_video(generation_result)
+            
+            if video_path:
+                # Post-process for seamless looping
+                processed_path, duration = await self._process_for_looping(video_path)
+                
+                result = {
+                    'filename': processed_path,
+                    'prompt': prompt,
+                    'mood': mood,
+                    'duration': duration,
+                    'resolution': VIDEO_SETTINGS['resolution'],
+                    'created_at': datetime.now().isoformat(),
+                    'metadata': metadata or {}
+                }
+                return await self._cache_store(cache_key, result)
+        
+        logger.error("❌ Background generation failed")
+        return None
+    
     def _enhance_prompt(self, base_prompt: str, mood: str, metadata: Optional[Dict]) -> str:
         """Enhance the base prompt with mood, time, and technical specifications"""
         
         # Start with base prompt
-        enhanced = base_prompt
-        
-        # Add mood-specific elements
-        if mood in self.mood_prompts:
-            mood_element = self.mood_prompts[mood][0]  # Use first option for consistency
-            enhanced += f", {mood_element}"
-        
-        # Add time-based elements
-        current_hour = datetime.now().hour
-        if 5 <= current_hour < 12:
-            enhanced += f", {self.time_themes['morning']}"
-        elif 12 <= current_hour < 17:
-            enhanced += f", {self.time_themes['afternoon']}"
-        elif 17 <= current_hour < 21:
-            enhanced += f", {self.time_themes['evening']}"
-        elif 21 <= current_hour < 24:
-            enhanced += f", {self.time_themes['night']}"
-        else:
-            enhanced += f", {self.time_themes['late_night']}"
-        
-        # Add seasonal elements
-        month = datetime.now().month
-        if month in [3, 4, 5]:
-            enhanced += f", {self.seasonal_themes['spring']}"
-        elif month in [6, 7, 8]:
-            enhanced += f", {self.seasonal_themes['summer']}"
-        elif month in [9, 10, 11]:
-            enhanced += f", {self.seasonal_themes['autumn']}"
-        else:
-            enhanced += f", {self.seasonal_themes['winter']}"
+        parts = [base_prompt] if base_prompt else []
+        
+        # Add mood-specific elements, rotating the variant daily
+        if mood in MOOD_PROMPTS:
+            parts.append(MOOD_PROMPTS[mood][self._mood_variant(mood)])
+        
+        # Add time-based and seasonal elements
+        parts.append(TIME_THEMES[self._time_of_day()])
+        parts.append(SEASONAL_THEMES[self._season()])
         
         # Add technical specifications
-        enhanced += (
-            f", seamless loop animation, {self.video_settings['duration']} seconds, "
-            f"smooth transitions, abstract style suitable for background, "
-            f"no text or logos, continuous motion, {self.video_settings['resolution']} resolution"
-        )
+        enhanced = ', '.join(parts) + self._prompt_tail
         
         return enhanced
     
+    @staticmethod
+    def _mood_variant(mood: str) -> int:
+        """Index of today's MOOD_PROMPTS variant, seeded per day so it is stable within a day"""
+        return random.Random(f"{mood}:{datetime.now().date()}").randrange(len(MOOD_PROMPTS[mood]))
+    
+    def _time_of_day(self) -> str:
+        """Current time bucket, a key of TIME_THEMES"""
+        return _HOUR_TO_TIME[datetime.now().hour]
+    
+    def _season(self) -> str:
+        """Current season, a key of SEASONAL_THEMES"""
+        return _MONTH_TO_SEASON[datetime.now().month - 1]
+    
     async def _call_firefly_api(self, prompt: str) -> Optional[Dict]:
         """Call Adobe Firefly API to generate video"""
         try:
             payload = {
                 'prompt': prompt,
-                'duration': self.video_settings['duration'],
-                'width': int(self.video_settings['resolution'].split('x')[0]),
-                'height': int(self.video_settings['resolution'].split('x')[1]),
-                'fps': self.video_settings['fps'],
-                'format': self.video_settings['format'],
+                'duration': VIDEO_SETTINGS['duration'],
+                'width': self.width,
+                'height': self.height,
+                'fps': VIDEO_SETTINGS['fps'],
+                'format': VIDEO_SETTINGS['format'],
                 'style': 'abstract',
                 'loop': True
             }
             
-            response = requests.post(
+            # Deterministic key so retries of the same prompt don't spawn duplicate jobs
+            idempotency_key = hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+            
+            status, result = await self._request_json(
+                'POST',
                 f"{self.api_url}/generate/video",
-                headers=self.headers,
-                json=payload,
-                timeout=self.timeout
+                idempotency_key=idempotency_key,
+                json=payload
             )
             
-            if response.status_code == 200:
-                result = response.json()
-                logger.info("✅ Video generation request successful")
-                
-                # Handle async generation (most AI APIs work this way)
-                if 'job_id' in result:
-                    return await self._wait_for_generation(result['job_id'])
-                else:
-                    return result
-            else:
-                logger.error(f"❌ API call failed: {response.status_code} - {response.text}")
+            if status != 200:
+                logger.error(f"❌ API call failed: {status} - {result}")
                 return None
+            
+            logger.info("✅ Video generation request successful")
+            
+            # Handle async generation (most AI APIs work this way)
+            if 'job_id' in result:
+                return await self._wait_for_generation(result['job_id'])
+            else:
+                return result
                 
         except Exception as e:
             logger.error(f"❌ Error calling Firefly API: {e}")
             return None
     
     async def _wait_for_generation(self, job_id: str, max_wait: int = 300) -> Optional[Dict]:
-        """Wait for async video generation to complete"""
-        start_time = time.time()
+        """Wait for async video generation to complete
+        
+        Polls with jittered exponential backoff (1s growing to 15s) against a monotonic
+        deadline, so jobs started together don't all poll in lockstep.
+        """
+        delay = 1.0
+        deadline = time.monotonic() + max_wait
         
-        while time.time() - start_time < max_wait:
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 1.7, 15.0)
+            
             try:
-                response = requests.get(
-                    f"{self.api_url}/jobs/{job_id}",
-                    headers=self.headers,
-                    timeout=30
+                status_code, result = await self._request_json(
+                    'GET',
+                    f"{self.api_url}/jobs/{job_id}"
                 )
                 
-                if response.status_code == 200:
-                    result = response.json()
+                if status_code == 200:
                     status = result.get('status', 'unknown')
                     
                     if status == 'completed':
@@ -282,131 +428,340 @@ class BackgroundGenerator:
                     else:
                         # Still processing
                         logger.info(f"⏳ Video generation in progress... ({status})")
-                        await asyncio.sleep(10)
                 else:
-                    logger.error(f"❌ Job status check failed: {response.status_code}")
-                    await asyncio.sleep(10)
+                    logger.error(f"❌ Job status check failed: {status_code}")
                     
             except Exception as e:
                 logger.error(f"❌ Error checking job status: {e}")
-                await asyncio.sleep(10)
         
         logger.error(f"❌ Video generation timeout (job: {job_id})")
         return None
     
     async def _download_video(self, generation_result: Dict) -> Optional[str]:
         """Download the generated video"""
+        filepath = None
         try:
             download_url = generation_result.get('download_url') or generation_result.get('url')
             if not download_url:
                 logger.error("❌ No download URL in generation result")
                 return None
             
-            # Generate unique filename
+            # Generate unique filename - concurrent downloads can finish in the same second
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"background_{timestamp}.mp4"
+            filename = f"background_{timestamp}_{uuid.uuid4().hex[:8]}.mp4"
             filepath = f"videos/backgrounds/{filename}"
             
-            # Download video
-            response = requests.get(download_url, timeout=60)
-            response.raise_for_status()
-            
-            # Save to file
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+            # Stream video straight to disk so memory stays bounded by the chunk size
+            async with self.semaphore, self.session.get(
+                download_url
+            ) as response:
+                response.raise_for_status()
+                
+                async with aiofiles.open(filepath, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(1024 * 1024):
+                        await f.write(chunk)
             
             logger.info(f"✅ Video downloaded: {filepath}")
             return filepath
             
         except Exception as e:
             logger.error(f"❌ Error downloading video: {e}")
+            # Don't leave a truncated file behind
+            if filepath:
+                Path(filepath).unlink(missing_ok=True)
+            return None
+    
+    @staticmethod
+    async def _probe_duration(video_path: str) -> Optional[float]:
+        """Container duration in seconds from ffprobe, or None if unavailable"""
+        proc = await asyncio.create_subprocess_exec(
+            'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+            '-of', 'default=noprint_wrappers=1:nokey=1', video_path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        data, _ = await proc.communicate()
+        
+        try:
+            return float(data) if proc.returncode == 0 else None
+        except ValueError:
+            return None
+    
+    async def _seam_error(self, video_path: str) -> Optional[float]:
+        """Mean squared error between the first and last frame, or None if unavailable
+        
+        The last frame is found by seeking from the end of the file, so this works
+        whatever length or frame rate the clip actually has.
+        """
+        width, height = 64, 36
+        scale = f"scale={width}:{height},format=gray"
+        
+        proc = await asyncio.create_subprocess_exec(
+            'ffmpeg', '-v', 'error', '-i', video_path, '-sseof', '-0.5', '-i', video_path,
+            '-filter_complex',
+            f"[0:v]trim=end_frame=1,{scale}[first];"
+            f"[1:v]{scale},reverse,trim=end_frame=1[last];"
+            f"[first][last]concat=n=2:v=1:a=0",
+            '-vsync', '0', '-f', 'rawvideo', '-',
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        data, _ = await proc.communicate()
+        
+        frame_size = width * height
+        if proc.returncode != 0 or len(data) < 2 * frame_size:
             return None
+        
+        frames = np.frombuffer(data[:2 * frame_size], dtype=np.uint8).reshape(2, frame_size).astype(np.float32)
+        return float(np.mean((frames[0] - frames[1]) ** 2))
     
-    async def _process_for_looping(self, video_path: str) -> str:
-        """Process video for seamless looping using ffmpeg"""
+    async def _process_for_looping(self, video_path: str) -> Tuple[str, float]:
+        """Process video for seamless looping using ffmpeg
+        
+        Returns the path to play and its duration in seconds.
+        """
+        duration = VIDEO_SETTINGS['duration']
         try:
-            output_path = video_path.replace('.mp4', '_loop.mp4')
+            # Use the clip's real length - Firefly may not honour the requested duration
+            duration = await self._probe_duration(video_path) or duration
+            
+            # Skip the re-encode when the generator already returned a seamless clip
+            seam_error = await self._seam_error(video_path)
+            if seam_error is not None and seam_error < self.loop_seam_threshold:
+                logger.info(f"✅ Video already loops seamlessly (seam MSE {seam_error:.1f})")
+                return video_path, duration
+            
+            fade = self.loop_crossfade
+            if duration <= 2 * fade:
+                logger.warning(f"⚠️ Video too short to crossfade ({duration:.1f}s), using as-is")
+                return video_path, duration
+            
+            source = Path(video_path)
+            output_path = str(source.with_name(f"{source.stem}_loop.mp4"))
             
-            # Use ffmpeg to create seamless loop
-            # This is a placeholder - actual implementation would use subprocess
-            # to call ffmpeg with appropriate filters for seamless looping
+            # Crossfade the tail into the head: the clip starts at K and ends on the
+            # blend back into frame K, so the loop point has no hard cut.
+            # setpts drops the link frame rate, and xfade requires a constant one
+            fps = VIDEO_SETTINGS['fps']
+            filter_graph = (
+                f"[0:v]split[body][head];"
+                f"[body]trim=start={fade},setpts=PTS-STARTPTS,fps={fps}[b];"
+                f"[head]trim=end={fade},setpts=PTS-STARTPTS,fps={fps}[h];"
+                f"[b][h]xfade=transition=fade:duration={fade}:offset={duration - 2 * fade},format=yuv420p"
+            )
+            
+            proc = await asyncio.create_subprocess_exec(
+                'ffmpeg', '-y', '-v', 'error', '-i', video_path,
+                '-filter_complex', filter_graph,
+                '-an', '-c:v', 'libx264', '-preset', 'veryfast', '-tune', 'fastdecode',
+                '-threads', '0', output_path,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await proc.communicate()
             
-            # For now, just copy the file
-            import shutil
-            shutil.copy2(video_path, output_path)
+            if proc.returncode != 0:
+                logger.error(f"❌ ffmpeg loop processing failed: {stderr.decode(errors='replace')[-500:]}")
+                # -y has already created (an empty) output file
+                Path(output_path).unlink(missing_ok=True)
+                return video_path, duration
             
             logger.info(f"✅ Video processed for looping: {output_path}")
-            return output_path
+            # The crossfade folds the first K seconds into the tail
+            return output_path, duration - fade
             
         except Exception as e:
             logger.error(f"❌ Error processing video for looping: {e}")
-            return video_path  # Return original if processing fails
+            return video_path, duration  # Return original if processing fails
     
     async def create_mood_background(self, mood: str, user_request: Optional[str] = None) -> Optional[Dict]:
         """Create a background based on mood and optional user request"""
         
-        # Get base prompt for mood
-        if mood in self.mood_prompts:
-            base_prompts = self.mood_prompts[mood]
-            base_prompt = base_prompts[0]  # Use first option for consistency
-        else:
-            base_prompt = "abstract flowing patterns with gentle movement"
+        # Mood imagery is added by _enhance_prompt; only unknown moods need a base prompt
+        parts = [] if mood in MOOD_PROMPTS else ["abstract flowing patterns with gentle movement"]
         
         # Enhance with user request if provided
         if user_request:
-            prompt = f"{base_prompt}, inspired by: {user_request}"
-        else:
-            prompt = base_prompt
+            parts.append(f"inspired by: {user_request}")
+        
+        prompt = ', '.join(parts)
         
         return await self.generate_background(prompt, mood)
     
     async def create_weather_background(self, weather_condition: str, mood: str = 'chill') -> Optional[Dict]:
         """Create a background based on weather conditions"""
         
-        weather_prompts = {
-            'rain': 'gentle raindrops on glass, soft reflections, peaceful atmosphere',
-            'sunny': 'warm sunlight filtering through, bright and cheerful',
-            'cloudy': 'soft cloud formations, muted lighting, calm ambiance',
-            'snow': 'gentle snowfall, winter wonderland, serene white landscape',
-            'storm': 'dramatic clouds with distant lightning, powerful yet beautiful',
-            'clear': 'clear skies with subtle gradients, peaceful and open'
-        }
-        
-        weather_prompt = weather_prompts.get(weather_condition, weather_prompts['clear'])
+        weather_prompt = WEATHER_PROMPTS.get(weather_condition, WEATHER_PROMPTS['clear'])
         return await self.generate_background(weather_prompt, mood, {'weather': weather_condition})
     
+    async def prewarm(self, moods: List[str]) -> List[Optional[Dict]]:
+        """Generate backgrounds for several moods concurrently to warm the cache
+        
+        All jobs share the session and request semaphore, so submissions and status
+        polls overlap instead of running one generation after another. Moods already
+        cached for the current time bucket and season return immediately.
+        """
+        logger.info(f"🔥 Pre-warming background cache for {len(moods)} moods...")
+        
+        results = await asyncio.gather(*(self.create_mood_background(mood) for mood in moods))
+        
+        warmed = sum(1 for result in results if result)
+        logger.info(f"✅ Background cache pre-warm complete: {warmed}/{len(moods)} ready")
+        return list(results)
+    
+    def _cache_key(self, prompt: str, mood: str) -> str:
+        """Cache key keeping the low-entropy mood/time/season/variant apart from the free-text prompt
+        
+        The daily mood variant is part of the key so a warm cache still rotates
+        through the alternatives instead of serving the first clip forever.
+        """
+        variant = f"v{self._mood_variant(mood)}" if mood in MOOD_PROMPTS else 'v-'
+        prompt_hash = hashlib.sha1(prompt.encode()).hexdigest()[:12]
+        return f"{mood}|{self._time_of_day()}|{self._season()}|{variant}|{prompt_hash}"
+    
+    def _load_cache_index(self) -> Dict[str, Dict]:
+        """Load the cache index from disk, starting empty if missing or corrupt
+        
+        Entries whose file has been removed are dropped so they no longer count
+        toward the cache size limit.
+        """
+        try:
+            with open(self.cache_index_path) as f:
+                index = json.load(f)
+            return {key: entry for key, entry in index.items() if os.path.exists(entry['result']['filename'])}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"⚠️ Ignoring unreadable background cache index: {e}")
+            return {}
+    
+    def _save_cache_index(self, index: Dict[str, Dict]):
+        """Persist a cache index snapshot with an atomic replace (runs in a worker thread)"""
+        try:
+            tmp_path = self.cache_index_path.with_suffix('.json.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self.cache_index_path)
+        except OSError as e:
+            logger.warning(f"⚠️ Failed to save background cache index: {e}")
+    
+    async def _persist_cache_index(self):
+        """Write the cache index off the event loop, one write at a time"""
+        # Snapshot on the loop so the worker thread never sees the index mid-update
+        snapshot = {key: dict(entry) for key, entry in self.cache_index.items()}
+        async with self._index_lock:
+            await asyncio.to_thread(self._save_cache_index, snapshot)
+    
+    @staticmethod
+    def _move_into_cache(source: str, cache_path: Path) -> int:
+        """Move a generated clip into the cache, returning its size in bytes"""
+        shutil.move(source, cache_path)
+        return cache_path.stat().st_size
+    
+    @staticmethod
+    def _unlink_all(paths: List[Path]):
+        """Delete evicted cache files, ignoring ones already gone"""
+        for path in paths:
+            path.unlink(missing_ok=True)
+    
+    def _cache_lookup(self, key: str) -> Optional[Dict]:
+        """Return the cached background for key, dropping entries whose file is gone
+        
+        Only the in-memory index is updated here; it is persisted on store/eviction
+        and at shutdown, so cache hits never write to disk on the event loop.
+        """
+        entry = self.cache_index.get(key)
+        if not entry:
+            return None
+        
+        if not os.path.exists(entry['result']['filename']):
+            del self.cache_index[key]
+            return None
+        
+        # Refresh recency for LRU eviction
+        entry['last_used'] = time.time()
+        return dict(entry['result'])
+    
+    async def _cache_store(self, key: str, result: Dict) -> Dict:
+        """Move a generated background into the cache and evict least recently used entries
+        
+        Returns the result pointing at the cached file, or the original result if
+        caching failed.
+        """
+        try:
+            digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+            cache_path = self.cache_dir / f"{result['mood']}_{digest}.mp4"
+            size = await asyncio.to_thread(self._move_into_cache, result['filename'], cache_path)
+            result = {**result, 'filename': str(cache_path)}
+            
+            self.cache_index[key] = {
+                'result': result,
+                'size': size,
+                'last_used': time.time()
+            }
+            
+            evicted = []
+            total_size = sum(entry['size'] for entry in self.cache_index.values())
+            for old_key, entry in sorted(self.cache_index.items(), key=lambda kv: kv[1]['last_used']):
+                if total_size <= self.cache_max_bytes:
+                    break
+                if old_key == key:
+                    continue
+                evicted.append(Path(entry['result']['filename']))
+                total_size -= entry['size']
+                del self.cache_index[old_key]
+            
+            if evicted:
+                await asyncio.to_thread(self._unlink_all, evicted)
+            await self._persist_cache_index()
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to cache background: {e}")
+        
+        return dict(result)
+    
     async def get_cached_background(self, mood: str, theme: Optional[str] = None) -> Optional[str]:
         """Get a cached background if available"""
-        cache_dir = Path('videos/cache')
         
-        # Look for cached backgrounds matching mood/theme
-        pattern = f"*{mood}*{theme or ''}*.mp4"
-        cached_files = list(cache_dir.glob(pattern))
+        # Look for cached backgrounds matching mood and time/season theme
+        matches = [
+            (key, entry) for key, entry in self.cache_index.items()
+            if entry['result']['mood'] == mood and (not theme or theme in key.split('|'))
+        ]
         
-        if cached_files:
-            # Return most recent cached file
-            latest_file = max(cached_files, key=lambda x: x.stat().st_mtime)
-            logger.info(f"📁 Using cached background: {latest_file}")
-            return str(latest_file)
+        # Prefer the most recently used file that still exists
+        for key, entry in sorted(matches, key=lambda kv: kv[1]['last_used'], reverse=True):
+            cached = self._cache_lookup(key)
+            if cached:
+                logger.info(f"📁 Using cached background: {cached['filename']}")
+                return cached['filename']
         
         return None
     
+    @staticmethod
+    def _sweep_old_videos(directories: List[str], cutoff_time: float) -> int:
+        """Delete .mp4 files older than cutoff_time, returning how many were removed"""
+        cleaned_count = 0
+        for directory in directories:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        # DirEntry caches the stat result, saving a syscall per file
+                        if entry.name.endswith('.mp4') and entry.stat().st_mtime < cutoff_time:
+                            os.unlink(entry.path)
+                            cleaned_count += 1
+            except FileNotFoundError:
+                continue
+        return cleaned_count
+    
     async def cleanup_old_backgrounds(self, keep_hours: int = 24):
         """Clean up old background videos to save disk space"""
         try:
-            import time
             cutoff_time = time.time() - (keep_hours * 3600)
             
-            backgrounds_dir = Path('videos/backgrounds')
-            cache_dir = Path('videos/cache')
-            
-            cleaned_count = 0
-            for directory in [backgrounds_dir, cache_dir]:
-                if directory.exists():
-                    for video_file in directory.glob('*.mp4'):
-                        if video_file.stat().st_mtime < cutoff_time:
-                            video_file.unlink()
-                            cleaned_count += 1
+            # videos/cache is bounded by the LRU index instead of by age
+            cleaned_count = await asyncio.to_thread(
+                self._sweep_old_videos, ['videos/backgrounds'], cutoff_time
+            )
             
             if cleaned_count > 0:
                 logger.info(f"🧹 Cleaned up {cleaned_count} old background videos")
@@ -418,7 +773,11 @@ class BackgroundGenerator:
         """Gracefully shutdown the background generator"""
         logger.info("🔄 Shutting down Background Generator...")
         
-        # Clean up resources
+        # Clean up resources and persist cache recency from this session
         await self.cleanup_old_backgrounds(keep_hours=2)
+        await self._persist_cache_index()
+        
+        if self.session and not self.session.closed:
+            await self.session.close()
         
         logger.info("✅ Background Generator shutdown complete")
\ No newline at end of file
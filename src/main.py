@@ -5,8 +5,12 @@ Orchestrates chat monitoring, music generation, and streaming
 """
 
 import asyncio
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import re
 import signal
 import sys
 from datetime import datetime
@@ -18,17 +22,37 @@ from queue_manager import MusicQueueManager
 from obs_controller import OBSController
 from prompt_generator import PromptGenerator
 
-# Configure logging
+try:
+    import uvloop
+except ImportError:  # optional - falls back to the default asyncio loop
+    uvloop = None
+
+# Configure logging - records are queued and written by a background thread
+# so file and stdout I/O never blocks the event loop
+Path('logs').mkdir(exist_ok=True)
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_handlers = [
+    logging.handlers.RotatingFileHandler('logs/app.log', maxBytes=50_000_000, backupCount=3),
+    logging.StreamHandler(sys.stdout)
+]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/app.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
+    format='%(message)s',  # Queued records are fully formatted by the listener's handlers
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
 logger = logging.getLogger(__name__)
 
+# Chat command: "!<command> <arguments>", matched in a single pass
+_CMD_RE = re.compile(r'^\s*!(\w+)(?:\s+(\S.*?))?\s*$')
+
 class InteractiveStreamManager:
     """Main application manager for the interactive AI music stream"""
     
@@ -36,6 +60,11 @@ class InteractiveStreamManager:
         self.running = False
         self.components = {}
         
+        # Event-driven hand-off between loops, created on the running loop in run()
+        self.chat_queue = None
+        self.generation_requested = None
+        self.track_added = None
+        
         # Initialize components
         self.chat_bot = YouTubeChatBot()
         self.music_generator = SunoMusicGenerator()
@@ -43,6 +72,13 @@ class InteractiveStreamManager:
         self.obs_controller = OBSController()
         self.prompt_generator = PromptGenerator()
         
+        # Chat command dispatch table (!<command> <args>)
+        self._commands = {
+            'generate': self._cmd_generate,
+            'mood': self._cmd_mood,
+            'vote': self._cmd_vote
+        }
+        
         # Register components for graceful shutdown
         self.components = {
             'chat_bot': self.chat_bot,
@@ -51,14 +87,32 @@ class InteractiveStreamManager:
             'obs_controller': self.obs_controller
         }
         
-        # Setup signal handlers
-        signal.signal(signal.SIGINT, self._signal_handler)
-        signal.signal(signal.SIGTERM, self._signal_handler)
+        # Gathered background tasks, cancelled on SIGINT/SIGTERM
+        self._main_task = None
     
     def _signal_handler(self, signum, frame):
-        """Handle shutdown signals gracefully"""
+        """Handle shutdown signals gracefully (fallback where the loop can't install handlers)"""
         logger.info(f"Received signal {signum}, initiating shutdown...")
         self.running = False
+        if self._main_task:
+            # Wake loops blocked on queues/events, same as the loop-installed handler
+            self._main_task.get_loop().call_soon_threadsafe(self._main_task.cancel)
+    
+    def _initiate_shutdown(self, signum):
+        """Stop the loops and cancel in-flight work from inside the event loop"""
+        logger.info(f"Received signal {signum}, initiating shutdown...")
+        self.running = False
+        if self._main_task:
+            self._main_task.cancel()
+    
+    def _install_signal_handlers(self):
+        """Route SIGINT/SIGTERM through the event loop so shutdown can cancel tasks"""
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self._initiate_shutdown, signum)
+            except NotImplementedError:  # Windows
+                signal.signal(signum, self._signal_handler)
     
     async def initialize(self):
         """Initialize all components"""
@@ -70,11 +124,20 @@ class InteractiveStreamManager:
             Path('logs').mkdir(exist_ok=True)
             Path('videos').mkdir(exist_ok=True)
             
-            # Initialize components
-            await self.chat_bot.initialize()
-            await self.music_generator.initialize()
-            await self.queue_manager.initialize()
-            await self.obs_controller.initialize()
+            # Initialize components concurrently - each is an independent handshake
+            results = await asyncio.gather(
+                *(component.initialize() for component in self.components.values()),
+                return_exceptions=True
+            )
+            
+            failed = False
+            for name, result in zip(self.components, results):
+                if isinstance(result, Exception):
+                    logger.error(f"❌ Failed to initialize {name}: {result}")
+                    failed = True
+            
+            if failed:
+                return False
             
             logger.info("✅ All components initialized successfully")
             return True
@@ -91,16 +154,24 @@ class InteractiveStreamManager:
         logger.info("🚀 Starting Interactive AI Music Stream...")
         self.running = True
         
+        self.chat_queue = asyncio.Queue(maxsize=1000)
+        self.generation_requested = asyncio.Event()
+        self.track_added = asyncio.Event()
+        
         # Start background tasks
         tasks = [
             asyncio.create_task(self._chat_monitoring_loop()),
+            asyncio.create_task(self._chat_processing_loop()),
             asyncio.create_task(self._music_generation_loop()),
             asyncio.create_task(self._queue_management_loop()),
             asyncio.create_task(self._status_monitoring_loop())
         ]
         
+        self._main_task = asyncio.gather(*tasks)
+        self._install_signal_handlers()
+        
         try:
-            await asyncio.gather(*tasks)
+            await self._main_task
         except asyncio.CancelledError:
             logger.info("Tasks cancelled, shutting down...")
         except Exception as e:
@@ -114,11 +185,14 @@ class InteractiveStreamManager:
         
         while self.running:
             try:
-                # Process chat messages
+                # Hand chat messages to the processing loop
                 messages = await self.chat_bot.get_recent_messages()
                 
                 for message in messages:
-                    await self._process_chat_message(message)
+                    try:
+                        self.chat_queue.put_nowait(message)
+                    except asyncio.QueueFull:
+                        logger.warning("⚠️ Chat queue full, dropping message")
                 
                 await asyncio.sleep(2)  # Check chat every 2 seconds
                 
@@ -126,33 +200,57 @@ class InteractiveStreamManager:
                 logger.error(f"Error in chat monitoring: {e}")
                 await asyncio.sleep(5)
     
+    async def _chat_processing_loop(self):
+        """Process queued chat messages as soon as they arrive"""
+        while self.running:
+            # Sleeps until a message arrives; shutdown cancels the gathered tasks
+            message = await self.chat_queue.get()
+            
+            try:
+                await self._process_chat_message(message)
+            except Exception as e:
+                logger.error(f"Error processing chat message: {e}")
+    
+    @staticmethod
+    async def _wait_event(event: asyncio.Event, timeout: float):
+        """Sleep until the event is set or the timeout elapses, then clear it"""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        event.clear()
+    
     async def _process_chat_message(self, message):
         """Process individual chat messages for commands"""
-        text = message.get('text', '').strip()
-        author = message.get('author', 'Unknown')
+        match = _CMD_RE.match(message.get('text', ''))
+        if not match:
+            return
         
-        if text.startswith('!'):
-            command = text[1:].lower().split()
-            
-            if command[0] == 'generate' and len(command) > 1:
-                # User requested specific music generation
-                prompt_text = ' '.join(command[1:])
-                prompt = self.prompt_generator.create_from_user_input(prompt_text, author)
-                await self.queue_manager.add_user_request(prompt, author)
-                logger.info(f"🎼 User {author} requested: {prompt_text}")
-                
-            elif command[0] == 'mood' and len(command) > 1:
-                # User requested mood-based generation
-                mood = ' '.join(command[1:])
-                prompt = self.prompt_generator.create_mood_prompt(mood, author)
-                await self.queue_manager.add_user_request(prompt, author)
-                logger.info(f"😊 User {author} requested mood: {mood}")
-                
-            elif command[0] == 'vote' and len(command) > 1:
-                # User voting on poll
-                vote = command[1].upper()
-                await self.queue_manager.process_vote(vote, author)
-                logger.info(f"🗳️ User {author} voted: {vote}")
+        command, args = match.groups()
+        handler = self._commands.get(command.lower())
+        if handler and args:
+            await handler(args, message.get('author', 'Unknown'))
+    
+    async def _cmd_generate(self, args, author):
+        """!generate <prompt> - user requested specific music generation"""
+        prompt = self.prompt_generator.create_from_user_input(args, author)
+        await self.queue_manager.add_user_request(prompt, author)
+        self.generation_requested.set()
+        logger.info(f"🎼 User {author} requested: {args}")
+    
+    async def _cmd_mood(self, args, author):
+        """!mood <mood> - user requested mood-based generation"""
+        mood = args.lower()
+        prompt = self.prompt_generator.create_mood_prompt(mood, author)
+        await self.queue_manager.add_user_request(prompt, author)
+        self.generation_requested.set()
+        logger.info(f"😊 User {author} requested mood: {mood}")
+    
+    async def _cmd_vote(self, args, author):
+        """!vote <option> - user voting on poll"""
+        vote = args.split(None, 1)[0].upper()
+        await self.queue_manager.process_vote(vote, author)
+        logger.info(f"🗳️ User {author} voted: {vote}")
     
     async def _music_generation_loop(self):
         """Generate music based on queue requests"""
@@ -175,11 +273,14 @@ class InteractiveStreamManager:
                     if result:
                         # Add generated music to playback queue
                         await self.queue_manager.add_generated_music(result)
+                        self.track_added.set()
                         logger.info(f"✅ Music generated successfully: {result['filename']}")
                     else:
                         logger.error("❌ Music generation failed")
+                    continue  # Check straight away for further queued requests
                 
-                await asyncio.sleep(10)  # Check for new requests every 10 seconds
+                # Wake on the next chat request, or re-check every 10 seconds
+                await self._wait_event(self.generation_requested, 10)
                 
             except Exception as e:
                 logger.error(f"Error in music generation: {e}")
@@ -204,7 +305,8 @@ class InteractiveStreamManager:
                         # Update stream overlay with track info
                         await self.obs_controller.update_track_info(next_track)
                 
-                await asyncio.sleep(5)  # Check playback status every 5 seconds
+                # Wake when a new track is queued, or check playback every 5 seconds
+                await self._wait_event(self.track_added, 5)
                 
             except Exception as e:
                 logger.error(f"Error in queue management: {e}")
@@ -224,9 +326,10 @@ class InteractiveStreamManager:
                     'uptime': datetime.now().isoformat()
                 }
                 
-                logger.info(f"📈 Status: Queue={status['queue_size']}, "
-                          f"Pending={status['generation_requests']}, "
-                          f"Stream={status['stream_status']}")
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info(f"📈 Status: Queue={status['queue_size']}, "
+                              f"Pending={status['generation_requests']}, "
+                              f"Stream={status['stream_status']}")
                 
                 await asyncio.sleep(60)  # Status update every minute
                 
@@ -238,13 +341,17 @@ class InteractiveStreamManager:
         """Gracefully shutdown all components"""
         logger.info("🔄 Shutting down Interactive AI Music Stream...")
         
-        for name, component in self.components.items():
-            try:
-                if hasattr(component, 'shutdown'):
-                    await component.shutdown()
-                    logger.info(f"✅ {name} shutdown complete")
-            except Exception as e:
-                logger.error(f"❌ Error shutting down {name}: {e}")
+        names = [name for name, component in self.components.items() if hasattr(component, 'shutdown')]
+        results = await asyncio.gather(
+            *(self.components[name].shutdown() for name in names),
+            return_exceptions=True
+        )
+        
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ Error shutting down {name}: {result}")
+            else:
+                logger.info(f"✅ {name} shutdown complete")
         
         logger.info("👋 Shutdown complete")
 
@@ -259,6 +366,10 @@ def main():
         logger.error("Please check your config/.env file")
         sys.exit(1)
     
+    # Use the libuv-based event loop when available
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    
     # Create and run the stream manager
     stream_manager = InteractiveStreamManager()
     
@@ -4,10 +4,15 @@ AI Music Streaming Platform - Simple Main Application for Initial Deployment
 This is a simplified version that can run without all dependencies for testing
 """
 
+import asyncio
+import atexit
 import os
+import queue
+import signal
 import sys
 import time
 import logging
+import logging.handlers
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -20,22 +25,44 @@ if env_path.exists():
 else:
     print(f"⚠️  No configuration file found at {env_path}")
 
-# Configure logging
+# Configure logging - records are queued and written by a background thread
+# so file and stdout I/O never blocks the scheduler loop
 log_level = os.getenv('LOG_LEVEL', 'INFO')
 log_dir = Path('/opt/ai-music-stream/logs')
 log_dir.mkdir(exist_ok=True, parents=True)
 
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+stream_handler = logging.StreamHandler(sys.stdout)
+stream_handler.setLevel(logging.WARNING)  # Full log goes to the file; stdout only carries problems
+log_handlers = [
+    stream_handler,
+    logging.FileHandler(log_dir / 'app.log', mode='a', delay=True)
+]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 logging.basicConfig(
     level=getattr(logging, log_level),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(log_dir / 'app.log', mode='a')
-    ]
+    format='%(message)s',  # Queued records are fully formatted by the listener's handlers
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
 
 logger = logging.getLogger(__name__)
 
+# Settings reported at startup, and the ones whose values must be masked
+CONFIG_ITEMS = (
+    ('SUNO_API_KEY', 'Suno API Key'),
+    ('YOUTUBE_STREAM_KEY', 'YouTube Stream Key'),
+    ('DAILY_BUDGET_USD', 'Daily Budget'),
+    ('GENERATION_INTERVAL_MINUTES', 'Generation Interval'),
+)
+SENSITIVE_KEYS = frozenset({'SUNO_API_KEY', 'YOUTUBE_STREAM_KEY'})
+
 class SimpleAIStreamApp:
     """Simplified AI Music Stream Application for initial deployment"""
     
@@ -45,43 +72,61 @@ class SimpleAIStreamApp:
         self.stream_title = os.getenv('STREAM_TITLE', 'AI Music Stream')
         self.port = 8081 if self.environment == 'development' else 8080
         
+        # Scheduling settings, read once rather than on every loop iteration
+        self.skip_generation = os.getenv('SKIP_MUSIC_GENERATION', 'false').lower() == 'true'
+        self.generation_interval = int(os.getenv('GENERATION_INTERVAL_MINUTES', '120')) * 60
+        self.health_check_interval = int(os.getenv('HEALTH_CHECK_INTERVAL', '300'))
+        
+        # A zero or negative interval would make the scheduler loops spin
+        if self.generation_interval < 1 or self.health_check_interval < 1:
+            logger.warning("⚠️  Scheduling intervals below 1 second are not supported - clamping to 1s")
+            self.generation_interval = max(self.generation_interval, 1)
+            self.health_check_interval = max(self.health_check_interval, 1)
+        
         logger.info(f"🎵 AI Music Stream starting...")
         logger.info(f"📺 Environment: {self.environment}")
         logger.info(f"📺 Stream: {self.stream_title}")
         logger.info(f"🚀 Port: {self.port}")
         logger.info(f"🐛 Debug: {self.debug_mode}")
         
+        # Set on SIGINT/SIGTERM, created on the running loop in run()
+        self._stop = None
+        self._start_ns = None
+        
         # Check configuration
         self._verify_config()
     
     def _verify_config(self):
         """Verify configuration and log status"""
-        config_items = [
-            ('SUNO_API_KEY', 'Suno API Key'),
-            ('YOUTUBE_STREAM_KEY', 'YouTube Stream Key'),
-            ('DAILY_BUDGET_USD', 'Daily Budget'),
-            ('GENERATION_INTERVAL_MINUTES', 'Generation Interval'),
-        ]
+        # Snapshot the checked settings in one pass over the environment
+        env = os.environ
+        self._env_snapshot = {env_var: env.get(env_var) for env_var, _ in CONFIG_ITEMS}
         
-        logger.info("🔧 Configuration Check:")
-        for env_var, description in config_items:
-            value = os.getenv(env_var)
+        # Build the whole report and emit it as a single record
+        lines = ["🔧 Configuration Check:"]
+        missing = False
+        for env_var, description in CONFIG_ITEMS:
+            value = self._env_snapshot[env_var]
             if value:
                 # Hide sensitive values
-                if 'KEY' in env_var:
+                if env_var in SENSITIVE_KEYS:
                     display_value = value[:10] + '...' if len(value) > 10 else '***'
                 else:
                     display_value = value
-                logger.info(f"  ✅ {description}: {display_value}")
+                lines.append(f"  ✅ {description}: {display_value}")
             else:
-                logger.warning(f"  ⚠️  {description}: Not configured")
+                lines.append(f"  ⚠️  {description}: Not configured")
+                missing = True
         
-        # Log budget information
-        daily_budget = os.getenv('DAILY_BUDGET_USD', '0.00')
+        # Budget information
+        daily_budget = self._env_snapshot['DAILY_BUDGET_USD'] or '0.00'
         max_generations = os.getenv('MAX_DAILY_GENERATIONS', '0')
-        logger.info(f"💰 Budget Configuration:")
-        logger.info(f"  💵 Daily Budget: ${daily_budget}")
-        logger.info(f"  🎵 Max Generations: {max_generations}")
+        lines.append("💰 Budget Configuration:")
+        lines.append(f"  💵 Daily Budget: ${daily_budget}")
+        lines.append(f"  🎵 Max Generations: {max_generations}")
+        
+        # Missing settings still surface on stdout, which only carries warnings
+        logger.log(logging.WARNING if missing else logging.INFO, "\n".join(lines))
     
     def health_check(self):
         """Health check endpoint"""
@@ -92,70 +137,96 @@ class SimpleAIStreamApp:
             'stream_title': self.stream_title,
             'port': self.port,
             'timestamp': int(time.time()),
-            'uptime_seconds': int(time.time() - self.start_time) if hasattr(self, 'start_time') else 0
+            'uptime_seconds': self._uptime_seconds()
         }
     
-    def run(self):
+    def _uptime_seconds(self):
+        """Whole seconds since run() started, immune to wall-clock adjustments"""
+        if self._start_ns is None:
+            return 0
+        return (time.monotonic_ns() - self._start_ns) // 1_000_000_000
+    
+    def _initiate_shutdown(self, signum):
+        """Wake the scheduler loops and let them exit after their current cycle"""
+        logger.info(f"🛑 Received signal {signum} - shutting down gracefully")
+        self._stop.set()
+    
+    async def _sleep_until(self, deadline_ns, interval_ns):
+        """Sleep until deadline_ns (monotonic), waking early on shutdown; returns the next deadline"""
+        timeout_ns = deadline_ns - time.monotonic_ns()
+        if timeout_ns > 0:
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout_ns / 1_000_000_000)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            # Already late - still yield so signals and the other loop get to run
+            await asyncio.sleep(0)
+        # Fixed-rate schedule; skip missed slots rather than running them back to back
+        return max(deadline_ns + interval_ns, time.monotonic_ns())
+    
+    async def _health_loop(self):
+        """Log a health check every health_check_interval seconds"""
+        health_check_count = 0
+        interval_ns = self.health_check_interval * 1_000_000_000
+        deadline_ns = time.monotonic_ns() + interval_ns
+        while not self._stop.is_set():
+            health_check_count += 1
+            health = self.health_check()
+            logger.info(f"💓 Health Check #{health_check_count}: {health['status']} "
+                      f"(uptime: {health['uptime_seconds']//60}m)")
+            deadline_ns = await self._sleep_until(deadline_ns, interval_ns)
+    
+    async def _generation_loop(self):
+        """Run a music generation cycle every generation_interval seconds"""
+        interval_ns = self.generation_interval * 1_000_000_000
+        deadline_ns = time.monotonic_ns() + interval_ns
+        while not self._stop.is_set():
+            logger.info("🎵 Music generation cycle triggered")
+            
+            if self.skip_generation:
+                logger.info("⏭️  Music generation skipped (SKIP_MUSIC_GENERATION=true)")
+            else:
+                # Simulate music generation process
+                logger.info("🎼 [SIMULATION] Checking API limits...")
+                logger.info("🎼 [SIMULATION] Generating city pop music...")
+                logger.info("🎼 [SIMULATION] Processing audio...")
+                logger.info("🎼 [SIMULATION] Music generation completed")
+            
+            deadline_ns = await self._sleep_until(deadline_ns, interval_ns)
+    
+    async def run(self):
         """Main application loop - simplified version"""
         logger.info("🚀 Starting AI Music Stream application...")
-        self.start_time = time.time()
+        self._start_ns = time.monotonic_ns()
         
         if self.debug_mode:
             logger.info("🧪 Running in DEBUG mode")
         
+        # Route SIGINT/SIGTERM through the event loop so shutdown interrupts the sleeps
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self._initiate_shutdown, signum)
+            except NotImplementedError:  # Windows - Ctrl+C still raises KeyboardInterrupt
+                pass
+        
         try:
-            generation_interval = int(os.getenv('GENERATION_INTERVAL_MINUTES', '120')) * 60
-            health_check_interval = int(os.getenv('HEALTH_CHECK_INTERVAL', '300'))
-            
-            last_generation_time = 0
-            last_health_check = 0
-            iteration_count = 0
-            
             logger.info(f"⚙️  Configuration:")
-            logger.info(f"  🎵 Music generation every {generation_interval//60} minutes")
-            logger.info(f"  💓 Health checks every {health_check_interval} seconds")
+            logger.info(f"  🎵 Music generation every {self.generation_interval//60} minutes")
+            logger.info(f"  💓 Health checks every {self.health_check_interval} seconds")
             
-            while True:
-                current_time = time.time()
-                iteration_count += 1
-                
-                # Health check and status log
-                if (current_time - last_health_check) >= health_check_interval:
-                    health = self.health_check()
-                    logger.info(f"💓 Health Check #{iteration_count//30}: {health['status']} "
-                              f"(uptime: {health['uptime_seconds']//60}m)")
-                    last_health_check = current_time
-                
-                # Simulated music generation cycle
-                if (current_time - last_generation_time) >= generation_interval:
-                    logger.info("🎵 Music generation cycle triggered")
-                    
-                    skip_generation = os.getenv('SKIP_MUSIC_GENERATION', 'false').lower() == 'true'
-                    if skip_generation:
-                        logger.info("⏭️  Music generation skipped (SKIP_MUSIC_GENERATION=true)")
-                    else:
-                        # Simulate music generation process
-                        logger.info("🎼 [SIMULATION] Checking API limits...")
-                        logger.info("🎼 [SIMULATION] Generating city pop music...")
-                        logger.info("🎼 [SIMULATION] Processing audio...")
-                        logger.info("🎼 [SIMULATION] Music generation completed")
-                    
-                    last_generation_time = current_time
-                
-                # Log iteration status every 10 cycles (100 seconds)
-                if iteration_count % 10 == 0:
-                    logger.debug(f"🔄 Iteration {iteration_count} - System running normally")
-                
-                # Sleep for 10 seconds before next iteration
-                time.sleep(10)
+            # Each loop sleeps until its own next deadline instead of polling every 10 seconds
+            await asyncio.gather(self._health_loop(), self._generation_loop())
                 
-        except KeyboardInterrupt:
-            logger.info("🛑 Received interrupt signal - shutting down gracefully")
+        except asyncio.CancelledError:
+            logger.info("🛑 Scheduler cancelled - shutting down gracefully")
         except Exception as e:
             logger.error(f"❌ Fatal error in main loop: {e}")
             raise
         finally:
-            uptime = int(time.time() - self.start_time) if hasattr(self, 'start_time') else 0
+            uptime = self._uptime_seconds()
             logger.info(f"👋 AI Music Stream stopped (uptime: {uptime//60}m {uptime%60}s)")
 
 def main():
@@ -165,8 +236,10 @@ def main():
     
     try:
         app = SimpleAIStreamApp()
-        app.run()
+        asyncio.run(app.run())
         
+    except KeyboardInterrupt:
+        logger.info("🛑 Received interrupt signal - shutting down gracefully")
     except Exception as e:
         logger.error(f"❌ Failed to start application: {e}")
         print(f"❌ Failed to start application: {e}")
@@ -4,17 +4,78 @@ Suno API Client for Music Generation
 Based on official SunoAPI.org documentation
 """
 
+import aiofiles
 import asyncio
 import aiohttp
-import json
+import orjson
 import logging
 import os
 import time
-from datetime import datetime
+import uuid
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
 from typing import Dict, List, Optional, Any
 
 logger = logging.getLogger(__name__)
 
+# Technical specifications appended to every city pop prompt
+_CITY_POP_SUFFIX = ", city pop genre, retro aesthetic, high quality production"
+
+# City Pop specific prompt templates per mood
+_CITY_POP_TEMPLATES = MappingProxyType({
+    'chill': (
+        "Relaxing city pop with smooth bass and dreamy synths, perfect for studying",
+        "Mellow lo-fi city pop with gentle guitar and soft vocals, nostalgic vibes",
+        "Chill city pop instrumental with warm piano and ambient textures"
+    ),
+    'energetic': (
+        "Upbeat city pop with funky bass and bright synths, retro energy",
+        "Energetic city pop with driving drums and catchy melodies, 80s inspired",
+        "Vibrant city pop with electric guitar and danceable rhythm"
+    ),
+    'romantic': (
+        "Romantic city pop with smooth saxophone and gentle vocals, sunset vibes",
+        "Dreamy city pop ballad with soft synths and heartfelt melody",
+        "Intimate city pop with warm vocals and tender instrumental"
+    ),
+    'melancholic': (
+        "Melancholic city pop with minor chords and reflective mood, rainy night",
+        "Bittersweet city pop with emotional vocals and wistful melody",
+        "Nostalgic city pop with gentle melancholy and urban atmosphere"
+    ),
+    'study': (
+        "Focus-friendly city pop instrumental, minimal vocals, concentration vibes",
+        "Study session city pop with repetitive, non-distracting melody",
+        "Ambient city pop perfect for background work, gentle and flowing"
+    )
+})
+
+# First template per mood, used for consistency
+_MOOD_TEMPLATE = MappingProxyType({mood: templates[0] for mood, templates in _CITY_POP_TEMPLATES.items()})
+
+# Time-of-day prompt suffix, indexed by local hour
+_HOUR_SUFFIX = tuple(
+    ", late night vibes, intimate atmosphere" if hour >= 22 or hour < 6 else
+    ", morning energy, fresh start feeling" if hour < 12 else
+    ", afternoon warmth, steady rhythm" if hour < 18 else
+    ", evening glow, winding down"
+    for hour in range(24)
+)
+
+@lru_cache(maxsize=256)
+def _build_city_pop_prompt(mood_template: str, base_prompt: str, time_suffix: str) -> str:
+    """Assemble a city pop prompt (memoized - templates and suffixes repeat across calls)"""
+    
+    # Combine user prompt with city pop template
+    if base_prompt.strip():
+        enhanced = f"{mood_template}, {base_prompt}"
+    else:
+        enhanced = mood_template
+    
+    return enhanced + _CITY_POP_SUFFIX + time_suffix
+
 class SunoAPIClient:
     """Official Suno API client for music generation"""
     
@@ -22,6 +83,9 @@ class SunoAPIClient:
         self.api_key = os.getenv('SUNO_API_KEY')
         self.api_url = os.getenv('SUNO_API_URL', 'https://api.sunoapi.org/api/v1')
         self.timeout = int(os.getenv('SUNO_API_TIMEOUT', '60'))
+        self.max_concurrency = int(os.getenv('SUNO_MAX_CONCURRENCY', '4'))
+        self.min_request_interval = 2.0  # seconds between generation request starts
+        self._music_dir = Path(os.getenv('MUSIC_DIR', 'music'))
         
         if not self.api_key:
             raise ValueError("SUNO_API_KEY environment variable is required")
@@ -31,6 +95,11 @@ class SunoAPIClient:
             'Content-Type': 'application/json'
         }
         
+        # Shared HTTP sessions, created in initialize() and closed in shutdown().
+        # API calls carry self.headers; audio downloads go to CDN URLs without auth
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._download_session: Optional[aiohttp.ClientSession] = None
+        
         # Model selection based on stage and quality needs
         self.models = {
             'balanced': 'v3_5',      # Stage 1: Cost-effective, good quality
@@ -41,34 +110,8 @@ class SunoAPIClient:
         # Default to balanced model for Stage 1
         self.current_model = self.models['balanced']
         
-        # City Pop specific prompt templates
-        self.city_pop_templates = {
-            'chill': [
-                "Relaxing city pop with smooth bass and dreamy synths, perfect for studying",
-                "Mellow lo-fi city pop with gentle guitar and soft vocals, nostalgic vibes",
-                "Chill city pop instrumental with warm piano and ambient textures"
-            ],
-            'energetic': [
-                "Upbeat city pop with funky bass and bright synths, retro energy",
-                "Energetic city pop with driving drums and catchy melodies, 80s inspired",
-                "Vibrant city pop with electric guitar and danceable rhythm"
-            ],
-            'romantic': [
-                "Romantic city pop with smooth saxophone and gentle vocals, sunset vibes",
-                "Dreamy city pop ballad with soft synths and heartfelt melody",
-                "Intimate city pop with warm vocals and tender instrumental"
-            ],
-            'melancholic': [
-                "Melancholic city pop with minor chords and reflective mood, rainy night",
-                "Bittersweet city pop with emotional vocals and wistful melody",
-                "Nostalgic city pop with gentle melancholy and urban atmosphere"
-            ],
-            'study': [
-                "Focus-friendly city pop instrumental, minimal vocals, concentration vibes",
-                "Study session city pop with repetitive, non-distracting melody",
-                "Ambient city pop perfect for background work, gentle and flowing"
-            ]
-        }
+        # City Pop specific prompt templates, shared across instances
+        self.city_pop_templates = _CITY_POP_TEMPLATES
         
         # Usage tracking for cost control
         self.daily_usage = {
@@ -79,31 +122,54 @@ class SunoAPIClient:
         
         self.cost_per_generation = 0.01  # $0.01 per song estimate
         self.daily_budget = float(os.getenv('DAILY_BUDGET_USD', '0.60'))
+        
+        # Cached clock-derived values, refreshed only when a local day/hour boundary passes
+        self._next_daily_reset = self._next_boundary(days=1)
+        self._time_suffix = ''
+        self._time_suffix_expires = 0.0
+    
+    @staticmethod
+    def _next_boundary(days: int = 0, hours: int = 0) -> float:
+        """Timestamp of the next local midnight (days=1) or top of the hour (hours=1)"""
+        now = datetime.now()
+        if days:
+            start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        else:
+            start = now.replace(minute=0, second=0, microsecond=0)
+        return (start + timedelta(days=days, hours=hours)).timestamp()
     
     async def initialize(self):
         """Initialize the Suno API client"""
         logger.info("🎵 Initializing Suno API Client...")
         
-        try:
-            # Test API connectivity
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.api_url}/health",
-                    headers=self.headers,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status in [200, 404]:  # 404 might mean no health endpoint
-                        logger.info("✅ Suno API connectivity confirmed")
-                        return True
-                    else:
-                        logger.warning(f"⚠️ Suno API returned status {response.status}")
-                        return True  # Continue anyway
-        except Exception as e:
-            logger.warning(f"⚠️ Suno API health check failed: {e}")
-            return True  # Continue anyway for now
+        # Ensure music directory exists once, rather than on every download
+        self._music_dir.mkdir(parents=True, exist_ok=True)
+        
+        # One pooled session keeps connections alive across generations
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300, keepalive_timeout=60)
+            )
+            # Same connection pool, but no Authorization header
+            self._download_session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=self._session.connector,
+                connector_owner=False
+            )
+        
+        # No /health probe: it never failed initialization, and the first
+        # generate call reports connectivity problems via its response status
+        logger.info("✅ Suno API client ready")
+        return True
     
     def _reset_daily_usage_if_needed(self):
         """Reset usage counter if it's a new day"""
+        if time.time() < self._next_daily_reset:
+            return
+        
+        self._next_daily_reset = self._next_boundary(days=1)
         today = datetime.now().date()
         if self.daily_usage['last_reset'] != today:
             self.daily_usage = {
@@ -155,27 +221,24 @@ class SunoAPIClient:
                 if 'style' in metadata:
                     payload['style'] = metadata['style']
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.api_url}/generate",
-                    headers=self.headers,
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=self.timeout)
-                ) as response:
+            async with self._session.post(
+                f"{self.api_url}/generate",
+                data=orjson.dumps(payload)  # Content-Type is set in self.headers
+            ) as response:
+                
+                if response.status == 200:
+                    result = orjson.loads(await response.read())
+                    
+                    # Track usage
+                    self._track_usage()
+                    
+                    # Process the result
+                    return await self._process_generation_result(result, enhanced_prompt, mood, metadata)
+                else:
+                    error_text = await response.text()
+                    logger.error(f"❌ Suno API error: {response.status} - {error_text}")
+                    return None
                     
-                    if response.status == 200:
-                        result = await response.json()
-                        
-                        # Track usage
-                        self._track_usage()
-                        
-                        # Process the result
-                        return await self._process_generation_result(result, enhanced_prompt, mood, metadata)
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"❌ Suno API error: {response.status} - {error_text}")
-                        return None
-                        
         except asyncio.TimeoutError:
             logger.error("⏰ Suno API timeout")
             return None
@@ -186,34 +249,19 @@ class SunoAPIClient:
     def _enhance_city_pop_prompt(self, base_prompt: str, mood: str) -> str:
         """Enhance prompt with city pop specific elements"""
         
-        # Get mood-specific template
-        if mood in self.city_pop_templates:
-            templates = self.city_pop_templates[mood]
-            mood_template = templates[0]  # Use first template for consistency
-        else:
-            mood_template = self.city_pop_templates['chill'][0]
+        # Get mood-specific template, falling back to chill
+        mood_template = _MOOD_TEMPLATE.get(mood) or _MOOD_TEMPLATE['chill']
         
-        # Combine user prompt with city pop template
-        if base_prompt.strip():
-            enhanced = f"{mood_template}, {base_prompt}"
-        else:
-            enhanced = mood_template
-        
-        # Add technical specifications for city pop
-        enhanced += ", city pop genre, retro aesthetic, high quality production"
-        
-        # Add time-based elements for variety
-        hour = datetime.now().hour
-        if 22 <= hour or hour < 6:
-            enhanced += ", late night vibes, intimate atmosphere"
-        elif 6 <= hour < 12:
-            enhanced += ", morning energy, fresh start feeling"
-        elif 12 <= hour < 18:
-            enhanced += ", afternoon warmth, steady rhythm"
-        else:
-            enhanced += ", evening glow, winding down"
+        # Add technical specifications and time-based elements for variety
+        return _build_city_pop_prompt(mood_template, base_prompt, self._get_time_suffix())
+    
+    def _get_time_suffix(self) -> str:
+        """Time-of-day prompt suffix, recomputed once per hour"""
+        if time.time() >= self._time_suffix_expires:
+            self._time_suffix = _HOUR_SUFFIX[datetime.now().hour]
+            self._time_suffix_expires = self._next_boundary(hours=1)
         
-        return enhanced
+        return self._time_suffix
     
     async def _process_generation_result(self, result: Dict, prompt: str, 
                                        mood: str, metadata: Optional[Dict]) -> Dict[str, Any]:
@@ -257,26 +305,22 @@ class SunoAPIClient:
         """Download generated audio file"""
         try:
             # Generate unique filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"cityPop_{timestamp}.mp3"
-            filepath = f"music/{filename}"
+            timestamp = time.strftime("%Y%m%d_%H%M%S", time.gmtime())
+            # Batch generations can finish in the same second - keep names collision-free
+            filepath = str(self._music_dir / f"cityPop_{timestamp}_{uuid.uuid4().hex[:8]}.mp3")
             
-            # Ensure music directory exists
-            os.makedirs('music', exist_ok=True)
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(audio_url) as response:
-                    if response.status == 200:
-                        with open(filepath, 'wb') as f:
-                            async for chunk in response.content.iter_chunked(8192):
-                                f.write(chunk)
-                        
-                        logger.info(f"✅ Audio downloaded: {filepath}")
-                        return filepath
-                    else:
-                        logger.error(f"❌ Failed to download audio: {response.status}")
-                        return None
-                        
+            async with self._download_session.get(audio_url) as response:
+                if response.status == 200:
+                    async with aiofiles.open(filepath, 'wb') as f:
+                        async for chunk in response.content.iter_chunked(262144):
+                            await f.write(chunk)
+                    
+                    logger.info(f"✅ Audio downloaded: {filepath}")
+                    return filepath
+                else:
+                    logger.error(f"❌ Failed to download audio: {response.status}")
+                    return None
+                    
         except Exception as e:
             logger.error(f"❌ Error downloading audio: {e}")
             return None
@@ -295,45 +339,73 @@ class SunoAPIClient:
                 'model_version': self.current_model
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.api_url}/generate/extend",
-                    headers=self.headers,
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=self.timeout)
-                ) as response:
+            async with self._session.post(
+                f"{self.api_url}/generate/extend",
+                data=orjson.dumps(payload)  # Content-Type is set in self.headers
+            ) as response:
+                
+                if response.status == 200:
+                    result = orjson.loads(await response.read())
+                    self._track_usage()
+                    return await self._process_generation_result(
+                        result, extension_prompt, 'extended', {'type': 'extension'}
+                    )
+                else:
+                    error_text = await response.text()
+                    logger.error(f"❌ Extension failed: {response.status} - {error_text}")
+                    return None
                     
-                    if response.status == 200:
-                        result = await response.json()
-                        self._track_usage()
-                        return await self._process_generation_result(
-                            result, extension_prompt, 'extended', {'type': 'extension'}
-                        )
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"❌ Extension failed: {response.status} - {error_text}")
-                        return None
-                        
         except Exception as e:
             logger.error(f"❌ Error extending music: {e}")
             return None
     
     async def generate_batch(self, prompts: List[str], mood: str = 'chill') -> List[Dict]:
-        """Generate multiple tracks in batch"""
-        results = []
+        """Generate multiple tracks in batch
         
-        for i, prompt in enumerate(prompts):
-            if not self._check_budget():
-                logger.warning(f"💸 Budget limit reached after {i} generations")
-                break
-            
-            result = await self.generate_music(prompt, mood)
-            if result:
-                results.append(result)
+        Up to max_concurrency generations run at once and request starts are spaced by
+        min_request_interval. Generations still in flight count against the budget so
+        concurrency can't overshoot it.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        start_lock = asyncio.Lock()
+        next_start = 0.0
+        in_flight = 0
+        budget_exhausted = False
+        
+        async def _generate_one(prompt: str) -> Optional[Dict]:
+            nonlocal next_start, in_flight, budget_exhausted
             
-            # Rate limiting - wait between generations
-            if i < len(prompts) - 1:
-                await asyncio.sleep(2)  # 2 second delay between generations
+            async with semaphore:
+                async with start_lock:
+                    if budget_exhausted:
+                        return None
+                    
+                    delay = next_start - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    next_start = time.monotonic() + self.min_request_interval
+                    
+                    self._reset_daily_usage_if_needed()
+                    projected_cost = self.daily_usage['cost_estimate'] + in_flight * self.cost_per_generation
+                    if projected_cost >= self.daily_budget:
+                        logger.warning("💸 Budget limit reached, skipping remaining batch prompts")
+                        budget_exhausted = True
+                        return None
+                    in_flight += 1
+                
+                try:
+                    return await self.generate_music(prompt, mood)
+                finally:
+                    in_flight -= 1
+        
+        outcomes = await asyncio.gather(*(_generate_one(p) for p in prompts), return_exceptions=True)
+        
+        results = []
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                logger.error(f"❌ Error in batch generation: {outcome}")
+            elif outcome:
+                results.append(outcome)
         
         return results
     
@@ -369,4 +441,9 @@ class SunoAPIClient:
         logger.info(f"📊 Final daily stats: {stats['daily_generations']} generations, "
                    f"${stats['daily_cost']:.2f} cost")
         
+        if self._download_session and not self._download_session.closed:
+            await self._download_session.close()
+        if self._session and not self._session.closed:
+            await self._session.close()
+        
         logger.info("✅ Suno API Client shutdown complete")
\ No newline at end of file